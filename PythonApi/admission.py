@@ -0,0 +1,189 @@
+"""
+Admission control for the analytics endpoints.
+
+Each endpoint gets a gate with a concurrency limit and a bounded wait queue.
+Requests are tagged as interactive (dashboard calls) or batch (bulk jobs).
+Interactive requests always leave the queue first, and batch requests can
+only use part of the slots, so interactive latency stays predictable when
+the service is overloaded.
+"""
+import asyncio
+import os
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Deque, Dict, Optional
+
+
+class Priority(str, Enum):
+    INTERACTIVE = "interactive"
+    BATCH = "batch"
+
+    @classmethod
+    def parse(cls, value: Optional[str]) -> "Priority":
+        """Map a header value to a priority class, defaulting to interactive"""
+        if value and value.strip().lower() == cls.BATCH.value:
+            return cls.BATCH
+        return cls.INTERACTIVE
+
+
+@dataclass
+class AdmissionLimits:
+    max_concurrent: int = 4
+    batch_max_concurrent: int = 2  # Slots batch traffic may occupy at once
+    max_queue: int = 16
+    queue_timeout: float = 5.0  # Seconds a request may wait for a slot
+    retry_after: int = 2  # Seconds suggested to rejected clients
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "AdmissionLimits":
+        """Read limits from environment variables such as ADMISSION_FORECAST_MAX_CONCURRENT"""
+        defaults = cls()
+        return cls(
+            max_concurrent=int(os.environ.get(f"{prefix}_MAX_CONCURRENT", defaults.max_concurrent)),
+            batch_max_concurrent=int(os.environ.get(f"{prefix}_BATCH_MAX_CONCURRENT", defaults.batch_max_concurrent)),
+            max_queue=int(os.environ.get(f"{prefix}_MAX_QUEUE", defaults.max_queue)),
+            queue_timeout=float(os.environ.get(f"{prefix}_QUEUE_TIMEOUT", defaults.queue_timeout)),
+            retry_after=int(os.environ.get(f"{prefix}_RETRY_AFTER", defaults.retry_after)),
+        )
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted"""
+
+    def __init__(self, endpoint: str, reason: str, retry_after: int):
+        super().__init__(f"{endpoint} is overloaded ({reason})")
+        self.endpoint = endpoint
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class EndpointGate:
+    """Concurrency limit and priority wait queue for a single endpoint.
+
+    All state is touched from the event loop only, so no lock is needed.
+    """
+
+    def __init__(self, name: str, limits: AdmissionLimits):
+        self.name = name
+        self.limits = limits
+        self._in_flight: Dict[Priority, int] = {p: 0 for p in Priority}
+        self._waiters: Dict[Priority, Deque[asyncio.Future]] = {p: deque() for p in Priority}
+        self._admitted_total = 0
+        self._rejected_total = 0
+
+    @property
+    def in_flight(self) -> int:
+        return sum(self._in_flight.values())
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self._waiters.values())
+
+    def _has_capacity(self, priority: Priority) -> bool:
+        if self.in_flight >= self.limits.max_concurrent:
+            return False
+        if priority == Priority.BATCH:
+            return self._in_flight[Priority.BATCH] < self.limits.batch_max_concurrent
+        return True
+
+    def _admit(self, priority: Priority) -> None:
+        self._in_flight[priority] += 1
+        self._admitted_total += 1
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self._rejected_total += 1
+        return AdmissionRejected(self.name, reason, self.limits.retry_after)
+
+    async def acquire(self, priority: Priority) -> None:
+        """Wait for a slot, raising AdmissionRejected if none becomes available"""
+        # Only skip the queue if nobody of equal or higher priority is waiting
+        ahead = len(self._waiters[Priority.INTERACTIVE])
+        if priority == Priority.BATCH:
+            ahead += len(self._waiters[Priority.BATCH])
+        if ahead == 0 and self._has_capacity(priority):
+            self._admit(priority)
+            return
+
+        if self.queued >= self.limits.max_queue:
+            # Interactive requests may displace the most recent batch waiter
+            if priority == Priority.INTERACTIVE and self._waiters[Priority.BATCH]:
+                evicted = self._waiters[Priority.BATCH].pop()
+                evicted.set_exception(self._reject("displaced by interactive traffic"))
+            else:
+                raise self._reject("queue full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        try:
+            await asyncio.wait_for(future, timeout=self.limits.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # On Python 3.12+ the deadline can fire in the same loop iteration
+                # that _dispatch handed over the slot (or evicted the waiter)
+                if future.exception() is None:
+                    return
+                raise future.exception()
+            self._discard(priority, future)
+            raise self._reject("queue timeout")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # The slot was handed over just before the client went away
+                self.release(priority)
+            else:
+                self._discard(priority, future)
+            raise
+
+    def release(self, priority: Priority) -> None:
+        """Free a slot and hand it to the next eligible waiter"""
+        self._in_flight[priority] -= 1
+        self._dispatch()
+
+    def _discard(self, priority: Priority, future: asyncio.Future) -> None:
+        try:
+            self._waiters[priority].remove(future)
+        except ValueError:
+            pass
+
+    def _dispatch(self) -> None:
+        for priority in (Priority.INTERACTIVE, Priority.BATCH):
+            waiters = self._waiters[priority]
+            while waiters and self._has_capacity(priority):
+                future = waiters.popleft()
+                if future.done():
+                    continue
+                self._admit(priority)
+                future.set_result(None)
+
+    def snapshot(self) -> Dict:
+        return {
+            "endpoint": self.name,
+            "in_flight": self.in_flight,
+            "in_flight_interactive": self._in_flight[Priority.INTERACTIVE],
+            "in_flight_batch": self._in_flight[Priority.BATCH],
+            "queued": self.queued,
+            "queued_interactive": len(self._waiters[Priority.INTERACTIVE]),
+            "queued_batch": len(self._waiters[Priority.BATCH]),
+            "max_concurrent": self.limits.max_concurrent,
+            "max_queue": self.limits.max_queue,
+            "admitted_total": self._admitted_total,
+            "rejected_total": self._rejected_total,
+        }
+
+
+class AdmissionController:
+    """Registry of per-endpoint gates"""
+
+    def __init__(self, limits: Optional[Dict[str, AdmissionLimits]] = None):
+        self._gates: Dict[str, EndpointGate] = {
+            name: EndpointGate(name, endpoint_limits)
+            for name, endpoint_limits in (limits or {}).items()
+        }
+
+    def gate(self, endpoint: str) -> EndpointGate:
+        if endpoint not in self._gates:
+            self._gates[endpoint] = EndpointGate(endpoint, AdmissionLimits())
+        return self._gates[endpoint]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: gate.snapshot() for name, gate in self._gates.items()}
@@ -1,15 +1,28 @@
 """
 Statistical analysis service for restaurant performance metrics
 """
+import hashlib
+import json
 import pandas as pd
 import numpy as np
 import httpx
 from scipy import stats
+from scipy.fft import next_fast_len
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_absolute_error, r2_score
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
-from models import DataPoint, CorrelationPair, ForecastPoint
+from typing import Dict, List, Optional, Tuple
+from profiling import profiled
+from models import DataPoint, CorrelationPair, ForecastPoint, LagCorrelation, MetricLagProfile
+
+
+@dataclass
+class RestaurantData:
+    """Raw records fetched from the .NET API, with a fingerprint of their content"""
+    revenue: List[Dict]
+    metrics: List[Dict]
+    fingerprint: str
 
 
 class AnalyticsService:
@@ -18,6 +31,7 @@ class AnalyticsService:
     def __init__(self):
         self.api_base_url = "http://apiservice"  # .NET API service URL
 
+    @profiled
     def calculate_correlations(
         self, 
         data_points: List[DataPoint], 
@@ -84,51 +98,71 @@ class AnalyticsService:
         
         return correlations
 
-    async def calculate_revenue_correlations(
+    @profiled
+    def calculate_revenue_correlations(
         self, 
-        restaurant_id: int,
+        data: Optional[RestaurantData],
         metrics: List[str],
         correlation_type: str = "pearson"
-    ) -> List[CorrelationPair]:
-        """Calculate correlations between metrics and revenue using real database data"""
+    ) -> Tuple[List[CorrelationPair], bool]:
+        """
+        Calculate correlations between metrics and revenue using data fetched from the .NET API.
+        Returns the correlations and whether they were generated from mock data.
+        """
+        
+        if data is None:
+            # Fallback to mock data for demo purposes
+            return self._generate_mock_correlations(metrics, correlation_type), True
+        
+        return self._calculate_metric_revenue_correlations(
+            data.revenue, data.metrics, metrics, correlation_type
+        )
+    
+    async def fetch_restaurant_data(self, restaurant_id: int) -> Optional[RestaurantData]:
+        """Fetch a restaurant's records from the .NET API, or None if they are unavailable"""
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # Fetch revenue data for the last 90 days
-                revenue_response = await client.get(
-                    f"{self.api_base_url}/api/restaurants/{restaurant_id}",
-                    params={"include_revenue": True, "days": 90}
-                )
-                
-                if revenue_response.status_code != 200:
-                    # Try alternative endpoint for revenue data
-                    revenue_response = await client.get(f"{self.api_base_url}/api/revenues")
-                    if revenue_response.status_code != 200:
-                        raise Exception(f"Failed to fetch revenue data: {revenue_response.status_code}")
-                
-                # Fetch metrics data for the same period
-                metrics_response = await client.get(
-                    f"{self.api_base_url}/api/metrics",
-                    params={"restaurant_id": restaurant_id, "days": 90}
-                )
-                
-                if metrics_response.status_code != 200:
-                    raise Exception(f"Failed to fetch metrics data: {metrics_response.status_code}")
-                
-                revenue_data = revenue_response.json()
-                metrics_data = metrics_response.json()
-                
-                return self._calculate_metric_revenue_correlations(
-                    revenue_data, metrics_data, metrics, correlation_type
-                )
-                
+            revenue_data, metrics_data = await self._fetch_restaurant_data(restaurant_id)
         except httpx.TimeoutException:
-            # Fallback to mock data for demo purposes
-            return self._generate_mock_correlations(metrics, correlation_type)
+            return None
         except Exception as e:
             print(f"Error fetching data from API: {e}")
-            # Fallback to mock data for demo purposes
-            return self._generate_mock_correlations(metrics, correlation_type)
+            return None
+        
+        # Identifies the content so unchanged data can be answered with 304
+        content = json.dumps([revenue_data, metrics_data], sort_keys=True, default=str).encode()
+        return RestaurantData(
+            revenue=revenue_data,
+            metrics=metrics_data,
+            fingerprint=hashlib.blake2b(content, digest_size=16).hexdigest()
+        )
+    
+    async def _fetch_restaurant_data(self, restaurant_id: int, days: int = 90) -> Tuple[List[Dict], List[Dict]]:
+        """Fetch raw revenue and metrics records for a restaurant from the .NET API"""
+        
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            # Fetch revenue data for the requested period
+            revenue_response = await client.get(
+                f"{self.api_base_url}/api/restaurants/{restaurant_id}",
+                params={"include_revenue": True, "days": days}
+            )
+            
+            if revenue_response.status_code != 200:
+                # Try alternative endpoint for revenue data
+                revenue_response = await client.get(f"{self.api_base_url}/api/revenues")
+                if revenue_response.status_code != 200:
+                    raise Exception(f"Failed to fetch revenue data: {revenue_response.status_code}")
+            
+            # Fetch metrics data for the same period
+            metrics_response = await client.get(
+                f"{self.api_base_url}/api/metrics",
+                params={"restaurant_id": restaurant_id, "days": days}
+            )
+            
+            if metrics_response.status_code != 200:
+                raise Exception(f"Failed to fetch metrics data: {metrics_response.status_code}")
+            
+            return revenue_response.json(), metrics_response.json()
     
     def _calculate_metric_revenue_correlations(
         self,
@@ -136,8 +170,8 @@ class AnalyticsService:
         metrics_data: List[Dict], 
         metrics: List[str],
         correlation_type: str
-    ) -> List[CorrelationPair]:
-        """Calculate correlations between specific metrics and revenue"""
+    ) -> Tuple[List[CorrelationPair], bool]:
+        """Calculate correlations between specific metrics and revenue, flagging mock fallbacks"""
         
         correlations = []
         
@@ -149,9 +183,9 @@ class AnalyticsService:
                     revenue_df['date'] = pd.to_datetime(revenue_df['date'])
                     revenue_df = revenue_df.set_index('date')
                 else:
-                    return self._generate_mock_correlations(metrics, correlation_type)
+                    return self._generate_mock_correlations(metrics, correlation_type), True
             else:
-                return self._generate_mock_correlations(metrics, correlation_type)
+                return self._generate_mock_correlations(metrics, correlation_type), True
             
             # Convert metrics data to DataFrame
             if isinstance(metrics_data, list) and len(metrics_data) > 0:
@@ -160,15 +194,15 @@ class AnalyticsService:
                     metrics_df['date'] = pd.to_datetime(metrics_df['timestamp']).dt.date
                     metrics_df = metrics_df.groupby(['date', 'metricName'])['value'].mean().unstack()
                 else:
-                    return self._generate_mock_correlations(metrics, correlation_type)
+                    return self._generate_mock_correlations(metrics, correlation_type), True
             else:
-                return self._generate_mock_correlations(metrics, correlation_type)
+                return self._generate_mock_correlations(metrics, correlation_type), True
             
             # Merge revenue and metrics data by date
             combined_df = revenue_df.join(metrics_df, how='inner')
             
             if len(combined_df) < 10:  # Need sufficient data points
-                return self._generate_mock_correlations(metrics, correlation_type)
+                return self._generate_mock_correlations(metrics, correlation_type), True
             
             # Calculate correlations between each metric and revenue
             for metric in metrics:
@@ -196,9 +230,11 @@ class AnalyticsService:
                         
         except Exception as e:
             print(f"Error in correlation calculation: {e}")
-            return self._generate_mock_correlations(metrics, correlation_type)
+            return self._generate_mock_correlations(metrics, correlation_type), True
         
-        return correlations if correlations else self._generate_mock_correlations(metrics, correlation_type)
+        if not correlations:
+            return self._generate_mock_correlations(metrics, correlation_type), True
+        return correlations, False
     
     def _generate_mock_correlations(self, metrics: List[str], correlation_type: str) -> List[CorrelationPair]:
         """Generate realistic mock correlations for demo purposes"""
@@ -235,6 +271,210 @@ class AnalyticsService:
         
         return correlations
 
+    @profiled
+    def calculate_lagged_revenue_correlations(
+        self,
+        data: Optional[RestaurantData],
+        metrics: List[str],
+        min_lag: int = 0,
+        max_lag: int = 14
+    ) -> Tuple[List[MetricLagProfile], int, bool]:
+        """
+        Cross-correlate each metric with revenue `lag` days later, for every lag in the range.
+        Returns the profiles, the number of days analysed and whether the data was synthetic.
+        """
+        
+        daily_df = None
+        if data is not None:
+            try:
+                daily_df = self._build_daily_frame(data.revenue, data.metrics)
+            except Exception as e:
+                print(f"Error preparing lagged correlation data: {e}")
+        
+        synthetic = daily_df is None
+        if synthetic:
+            # Fallback to mock data for demo purposes
+            daily_df = self._generate_mock_daily_frame(metrics, days=90 + max(abs(min_lag), abs(max_lag)))
+        
+        # Lags without enough overlapping days are dropped from the profiles
+        profiles = self._calculate_lagged_correlations(daily_df, metrics, min_lag, max_lag)
+        return profiles, len(daily_df), synthetic
+    
+    def _build_daily_frame(self, revenue_data: List[Dict], metrics_data: List[Dict]) -> Optional[pd.DataFrame]:
+        """Build a daily frame with one column per metric plus totalRevenue, NaN on days without data"""
+        
+        if not isinstance(revenue_data, list) or not isinstance(metrics_data, list):
+            return None
+        if not revenue_data or not metrics_data:
+            return None
+        
+        revenue_df = pd.DataFrame(revenue_data)
+        metrics_df = pd.DataFrame(metrics_data)
+        if not {'date', 'totalRevenue'} <= set(revenue_df.columns):
+            return None
+        if not {'timestamp', 'value', 'metricName'} <= set(metrics_df.columns):
+            return None
+        
+        revenue_df['date'] = pd.to_datetime(revenue_df['date'], utc=True).dt.tz_localize(None).dt.normalize()
+        metrics_df['date'] = pd.to_datetime(metrics_df['timestamp'], utc=True).dt.tz_localize(None).dt.normalize()
+        
+        daily_revenue = revenue_df.groupby('date')['totalRevenue'].sum()
+        daily_metrics = metrics_df.groupby(['date', 'metricName'])['value'].mean().unstack()
+        combined_df = daily_metrics.join(daily_revenue, how='inner')
+        if combined_df.empty:
+            return None
+        
+        # Lags are measured in days, so every calendar day gets a row; days without
+        # data stay NaN so they are not counted as observations
+        full_range = pd.date_range(combined_df.index.min(), combined_df.index.max(), freq='D')
+        return combined_df.reindex(full_range)
+    
+    def _generate_mock_daily_frame(self, metrics: List[str], days: int = 90) -> pd.DataFrame:
+        """Generate a synthetic daily frame where each metric leads revenue by a few days"""
+        
+        # Sign and lead time (in days) of each metric's effect on revenue
+        mock_effects = {
+            "prep_time": (-0.75, 2),
+            "table_turnover": (-0.45, 1),
+            "order_accuracy": (0.68, 5),
+            "customer_satisfaction": (0.82, 7),
+            "wait_time": (-0.58, 3),
+        }
+        
+        rng = np.random.default_rng()
+        max_lead = max(lead for _, lead in mock_effects.values())
+        revenue = rng.normal(0, 0.5, days)
+        columns = {}
+        
+        for metric in metrics:
+            weight, lead = mock_effects.get(metric, (0.0, 0))
+            signal = rng.normal(0, 1, days + max_lead)
+            columns[metric] = 50 + 10 * signal[max_lead:]
+            # Revenue on day t responds to the metric on day t - lead
+            revenue += weight * signal[max_lead - lead:max_lead - lead + days]
+        
+        columns['totalRevenue'] = 5000 + 800 * revenue
+        index = pd.date_range(end=pd.Timestamp.utcnow().normalize().tz_localize(None), periods=days, freq='D')
+        return pd.DataFrame(columns, index=index)
+    
+    def _calculate_lagged_correlations(
+        self,
+        daily_df: pd.DataFrame,
+        metrics: List[str],
+        min_lag: int,
+        max_lag: int
+    ) -> List[MetricLagProfile]:
+        """Build a lag profile for every requested metric present in the daily frame"""
+        
+        columns = [m for m in metrics if m in daily_df.columns and daily_df[m].notna().any()]
+        if not columns or 'totalRevenue' not in daily_df.columns:
+            return []
+        
+        lags = np.arange(min_lag, max_lag + 1)
+        lags = lags[np.abs(lags) < len(daily_df)]
+        if len(lags) == 0:
+            return []
+        
+        coefficients, overlaps = self._lagged_pearson(
+            daily_df[columns].to_numpy(dtype=float),
+            daily_df['totalRevenue'].to_numpy(dtype=float),
+            lags
+        )
+        # Need minimum data points observed on both sides of the lag
+        coefficients = np.where(overlaps >= 10, coefficients, np.nan)
+        
+        # Two-sided t-test for each coefficient, with n - 2 degrees of freedom
+        dof = np.maximum(overlaps - 2, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_stats = coefficients * np.sqrt(dof / (1 - coefficients ** 2))
+        p_values = 2 * stats.t.sf(np.abs(t_stats), dof)
+        
+        profiles = []
+        for col, metric in enumerate(columns):
+            valid = ~np.isnan(coefficients[:, col])
+            if not valid.any():
+                continue
+            
+            lag_points = [
+                LagCorrelation(
+                    lag_days=int(lags[i]),
+                    correlation_coefficient=float(coefficients[i, col]),
+                    p_value=float(p_values[i, col]),
+                    data_points=int(overlaps[i, col])
+                )
+                for i in np.flatnonzero(valid)
+            ]
+            best = max(lag_points, key=lambda point: abs(point.correlation_coefficient))
+            
+            profiles.append(MetricLagProfile(
+                metric=metric,
+                lags=lag_points,
+                best_lag_days=best.lag_days,
+                best_correlation_coefficient=best.correlation_coefficient,
+                best_p_value=best.p_value,
+                strength=self._get_correlation_strength(abs(best.correlation_coefficient)),
+                significant=best.p_value < 0.05
+            ))
+        
+        return profiles
+    
+    @staticmethod
+    def _lagged_pearson(
+        values: np.ndarray,
+        target: np.ndarray,
+        lags: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pearson correlation of values[t, j] with target[t + lag] for every lag and column,
+        using only the days where both sides were observed (NaN marks a missing day).
+        
+        Every sum the coefficient needs (pair counts, sums, sums of squares and cross
+        products over the overlapping observed days) is a cross-correlation of the
+        zero-filled values with the observation masks, so all lags come from a handful
+        of FFTs: O(n log n) per column instead of one O(n) correlation per lag.
+        Returns the coefficients and the number of paired observations, both of
+        shape (len(lags), n_columns).
+        """
+        n = len(target)
+        x_mask = ~np.isnan(values)
+        y_mask = ~np.isnan(target)
+        # Centering does not change the coefficients but keeps the sums well conditioned
+        with np.errstate(invalid='ignore'):
+            x = np.where(x_mask, values - np.nanmean(values, axis=0), 0.0)
+            y = np.where(y_mask, target - np.nanmean(target), 0.0)
+        x_mask = x_mask.astype(float)
+        y_mask = y_mask.astype(float)
+        
+        # Zero padding to at least 2n - 1 turns the circular correlation into a linear one
+        nfft = next_fast_len(2 * n - 1)
+        index = lags % nfft
+        
+        def spectrum(a):
+            return np.fft.rfft(a, nfft, axis=0)
+        
+        def correlate(x_spectrum, y_spectrum):
+            """sum_t a[t] * b[t + lag] for every lag, with a given by x_spectrum and b by y_spectrum"""
+            if y_spectrum.ndim == 1:
+                y_spectrum = y_spectrum[:, None]
+            return np.fft.irfft(np.conj(x_spectrum) * y_spectrum, nfft, axis=0)[index]
+        
+        fx, fxx, fmx = spectrum(x), spectrum(x ** 2), spectrum(x_mask)
+        fy, fyy, fmy = spectrum(y), spectrum(y ** 2), spectrum(y_mask)
+        
+        overlap = np.rint(correlate(fmx, fmy))
+        sxy = correlate(fx, fy)
+        sx = correlate(fx, fmy)
+        sy = correlate(fmx, fy)
+        sxx = correlate(fxx, fmy)
+        syy = correlate(fmx, fyy)
+        
+        numerator = overlap * sxy - sx * sy
+        denominator = np.sqrt(np.clip(overlap * sxx - sx ** 2, 0, None) * np.clip(overlap * syy - sy ** 2, 0, None))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            coefficients = np.where(denominator > 1e-12, numerator / denominator, np.nan)
+        return np.clip(coefficients, -1.0, 1.0), overlap.astype(int)
+
+    @profiled
     def forecast_revenue(
         self, 
         historical_data: List[Dict], 
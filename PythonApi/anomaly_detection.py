@@ -0,0 +1,149 @@
+"""
+Streaming anomaly detection for ingested restaurant metrics.
+
+Every (restaurant, metric) pair gets an exponentially weighted mean/variance
+tracker that is updated in O(1) time and memory per point. Points whose
+z-score against the running baseline exceeds the threshold are recorded in a
+bounded event buffer that can be queried or long-polled.
+"""
+import asyncio
+import math
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+from models import AnomalyEvent, MetricPoint
+
+
+class EwmaDetector:
+    """Exponentially weighted mean and variance of a single metric stream"""
+
+    __slots__ = ("alpha", "min_relative_std", "min_std", "mean", "variance", "count")
+
+    def __init__(self, alpha: float, min_relative_std: float = 0.01, min_std: float = 1e-6):
+        self.alpha = alpha
+        # Floor for the standard deviation so flat baselines still flag large jumps
+        self.min_relative_std = min_relative_std
+        self.min_std = min_std
+        self.mean = 0.0
+        self.variance = 0.0
+        self.count = 0
+
+    def update(self, value: float) -> Tuple[float, Optional[float]]:
+        """Fold a value into the baseline, returning the prior mean and the value's z-score"""
+        if self.count == 0:
+            self.mean = value
+            self.count = 1
+            return value, None
+
+        expected = self.mean
+        diff = value - expected
+        std = max(math.sqrt(self.variance), self.min_relative_std * abs(expected), self.min_std)
+        z_score = diff / std
+
+        increment = self.alpha * diff
+        self.mean += increment
+        self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+        self.count += 1
+        return expected, z_score
+
+
+class AnomalyDetector:
+    """Per-(restaurant, metric) detectors plus a bounded buffer of anomaly events"""
+
+    def __init__(
+        self,
+        alpha: float = 0.1,
+        threshold: float = 3.0,
+        warmup: int = 10,
+        buffer_size: int = 1000,
+        min_relative_std: float = 0.01
+    ):
+        self.alpha = alpha
+        self.min_relative_std = min_relative_std
+        self.threshold = threshold
+        self.warmup = warmup  # Points needed before a baseline is trusted
+        self._lock = threading.Lock()
+        self._detectors: Dict[Tuple[int, str], EwmaDetector] = {}
+        self._events: Deque[AnomalyEvent] = deque(maxlen=buffer_size)
+        self._last_event_id = 0
+        self._waiters: List[asyncio.Future] = []
+
+    @property
+    def last_event_id(self) -> int:
+        return self._last_event_id
+
+    def ingest(self, points: List[MetricPoint]) -> List[AnomalyEvent]:
+        """Update the detectors with new points in arrival order and return any anomalies"""
+        detected = []
+
+        with self._lock:
+            for point in points:
+                key = (point.restaurant_id, point.metric_name)
+                detector = self._detectors.get(key)
+                if detector is None:
+                    detector = self._detectors[key] = EwmaDetector(self.alpha, self.min_relative_std)
+
+                # The baseline is only trusted once it has seen enough points
+                warmed_up = detector.count >= self.warmup
+                expected, z_score = detector.update(point.value)
+
+                if warmed_up and z_score is not None and abs(z_score) >= self.threshold:
+                    self._last_event_id += 1
+                    event = AnomalyEvent(
+                        id=self._last_event_id,
+                        restaurant_id=point.restaurant_id,
+                        metric_name=point.metric_name,
+                        timestamp=point.timestamp,
+                        value=point.value,
+                        expected_value=expected,
+                        z_score=z_score,
+                        direction="spike" if z_score > 0 else "drop",
+                        detected_at=datetime.utcnow()
+                    )
+                    self._events.append(event)
+                    detected.append(event)
+
+            waiters, self._waiters = (self._waiters, []) if detected else ([], self._waiters)
+
+        for waiter in waiters:
+            waiter.get_loop().call_soon_threadsafe(self._wake, waiter)
+
+        return detected
+
+    def get_events(
+        self,
+        since_id: int = 0,
+        restaurant_id: Optional[int] = None,
+        metric_name: Optional[str] = None,
+        limit: int = 100
+    ) -> List[AnomalyEvent]:
+        """Return buffered events newer than since_id, oldest first"""
+        with self._lock:
+            events = [
+                event for event in self._events
+                if event.id > since_id
+                and (restaurant_id is None or event.restaurant_id == restaurant_id)
+                and (metric_name is None or event.metric_name == metric_name)
+            ]
+        return events[:limit]
+
+    async def wait_for_events(self, since_id: int, timeout: float) -> None:
+        """Block until an event newer than since_id is recorded or the timeout expires"""
+        with self._lock:
+            if self._last_event_id > since_id:
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter, timeout=timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    @staticmethod
+    def _wake(waiter: asyncio.Future) -> None:
+        if not waiter.done():
+            waiter.set_result(None)
@@ -1,13 +1,25 @@
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional
 import threading
+import uuid
 
 
 class InMemoryDatabase:
     def __init__(self):
         self._lock = threading.Lock()
-        # Add your data storage here
+        # Identifies this process so versions from before a restart never match
+        self.instance_id = uuid.uuid4().hex[:8]
+        self._data_versions: Dict[int, int] = {}
     
-    # Add your database methods here
+    def get_data_version(self, restaurant_id: int) -> int:
+        """Current data version of a restaurant, 0 if nothing has been ingested"""
+        with self._lock:
+            return self._data_versions.get(restaurant_id, 0)
+    
+    def bump_data_versions(self, restaurant_ids: Iterable[int]) -> None:
+        """Mark new data for each restaurant so cached analytics become stale"""
+        with self._lock:
+            for restaurant_id in set(restaurant_ids):
+                self._data_versions[restaurant_id] = self._data_versions.get(restaurant_id, 0) + 1
 
 
-db = InMemoryDatabase()
\ No newline at end of file
+db = InMemoryDatabase()
@@ -1,12 +1,26 @@
-from fastapi import FastAPI, HTTPException
+import hashlib
+import time
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 from datetime import datetime
+from typing import List, Literal, Optional
 from models import (
     CorrelationRequest, CorrelationResponse, 
-    ForecastRequest, ForecastResponse
+    LaggedCorrelationRequest, LaggedCorrelationResponse,
+    ForecastRequest, ForecastResponse,
+    MetricIngestRequest, MetricIngestResponse, AnomalyListResponse,
+    ProfileRecord, ProfileSummary,
+    SimilarRestaurantsResponse,
+    AdmissionGauge, AdmissionStatsResponse
 )
-from analytics_service import AnalyticsService
+from analytics_service import AnalyticsService, RestaurantData
+from database import db
+from anomaly_detection import AnomalyDetector
+from profiling import RequestProfiler
+from similarity_index import SimilarityIndex
+from admission import AdmissionController, AdmissionLimits, AdmissionRejected, Priority
 
 app = FastAPI(
     title="Vida AI Analytics Engine",
@@ -20,6 +34,131 @@ app = FastAPI(
 # Initialize analytics service
 analytics_service = AnalyticsService()
 
+# Online anomaly detection over ingested metric points
+anomaly_detector = AnomalyDetector()
+
+# Feature vectors of ingested metric profiles for cross-restaurant search
+similarity_index = SimilarityIndex()
+
+# Per-endpoint concurrency limits for the analytics endpoints
+admission_controller = AdmissionController({
+    "correlation": AdmissionLimits.from_env("ADMISSION_CORRELATION"),
+    "lagged_correlation": AdmissionLimits.from_env("ADMISSION_LAGGED_CORRELATION"),
+    "forecast": AdmissionLimits.from_env("ADMISSION_FORECAST"),
+})
+
+# Opt-in request profiling, stored in a bounded ring buffer
+request_profiler = RequestProfiler.from_env()
+
+
+def profiling_guard(endpoint: str):
+    """Dependency that profiles the request when `X-Profile: true` is sent
+    or it is picked by PROFILE_SAMPLE_RATE. The profile id is returned in `X-Profile-Id`."""
+    async def guard(request: Request, response: Response, x_profile: Optional[str] = Header(default=None)):
+        requested = x_profile is not None and x_profile.strip().lower() in ("1", "true", "yes")
+        if not request_profiler.should_profile(requested):
+            yield None
+            return
+        
+        session = request_profiler.start(endpoint)
+        try:
+            body = await request.json()
+            session.restaurant_id = body.get("restaurant_id")
+        except Exception:
+            pass
+        response.headers["X-Profile-Id"] = str(session.profile_id)
+        try:
+            yield session
+        finally:
+            request_profiler.detach(session)
+            await run_in_threadpool(request_profiler.finish, session)
+    return guard
+
+
+def conditional_guard(endpoint: str, fetches_data: bool = False):
+    """Dependency that answers `If-None-Match` with 304 when the request parameters and
+    the data behind the response are unchanged, before any work is queued.
+
+    Returns the ETag key built from the body and the restaurant's data version.
+    Endpoints backed by the .NET API (`fetches_data`) only learn the rest of their
+    ETag once the handler has fetched the records after admission, so they finish
+    the check themselves with `data_etag` and `check_not_modified`."""
+    async def guard(request: Request, if_none_match: Optional[str] = Header(default=None)):
+        body = await request.body()
+        try:
+            restaurant_id = int((await request.json()).get("restaurant_id"))
+        except Exception:
+            return None  # Let request validation report the problem
+        
+        version = db.get_data_version(restaurant_id)
+        digest = hashlib.blake2b(body, digest_size=8)
+        digest.update(f"{endpoint}:{db.instance_id}:{restaurant_id}:{version}".encode())
+        key = digest.hexdigest()
+        
+        if not fetches_data:
+            check_not_modified(data_etag(key), if_none_match)
+        return key
+    return guard
+
+
+def data_etag(key: Optional[str], data: Optional[RestaurantData] = None) -> Optional[str]:
+    """ETag for a conditional_guard key plus the fingerprint of any fetched records"""
+    if key is None:
+        return None
+    digest = hashlib.blake2b(key.encode(), digest_size=8)
+    if data is not None:
+        digest.update(data.fingerprint.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def check_not_modified(etag: Optional[str], if_none_match: Optional[str]) -> None:
+    """Raise 304 if the client already holds this ETag"""
+    if etag is None or not if_none_match:
+        return
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if etag in candidates or "*" in candidates:
+        raise HTTPException(status_code=304, headers=etag_headers(etag))
+
+
+def etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def set_etag(response: Response, etag: Optional[str]) -> None:
+    """Attach an ETag to a successful response"""
+    if etag is not None:
+        response.headers.update(etag_headers(etag))
+
+
+# Shared instances so the handlers receive the same cached result the route dependency computed
+correlation_conditional = conditional_guard("correlation", fetches_data=True)
+lagged_correlation_conditional = conditional_guard("lagged_correlation", fetches_data=True)
+forecast_conditional = conditional_guard("forecast")
+
+
+DEFAULT_METRICS = ["prep_time", "table_turnover", "order_accuracy", "customer_satisfaction", "wait_time"]
+
+
+def admission_guard(endpoint: str):
+    """Dependency that holds an admission slot for the duration of the request.
+    Callers mark bulk jobs with `X-Request-Priority: batch`."""
+    async def guard(x_request_priority: Optional[str] = Header(default=None)):
+        priority = Priority.parse(x_request_priority)
+        gate = admission_controller.gate(endpoint)
+        try:
+            await gate.acquire(priority)
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Service overloaded: {e.reason}",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        try:
+            yield priority
+        finally:
+            gate.release(priority)
+    return guard
+
 # Configure CORS to allow all origins
 app.add_middleware(
     CORSMiddleware,
@@ -42,25 +181,72 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow()}
 
 
+@app.get("/admission/stats", response_model=AdmissionStatsResponse)
+async def admission_stats():
+    """In-flight and queued request gauges for each analytics endpoint"""
+    return AdmissionStatsResponse(
+        endpoints=[AdmissionGauge(**gauge) for gauge in admission_controller.snapshot().values()],
+        timestamp=datetime.utcnow()
+    )
+
+
+@app.get("/admin/profiles", response_model=List[ProfileSummary])
+async def list_profiles():
+    """Summaries of the most recent request profiles, newest first"""
+    return request_profiler.list_profiles()
+
+
+@app.get("/admin/profiles/{profile_id}", response_model=ProfileRecord)
+async def get_profile(profile_id: int):
+    """Full call tree and allocation summary for a captured request profile"""
+    profile = request_profiler.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return profile
+
+
 # Statistical Analysis Endpoints
-@app.post("/analytics/correlation", response_model=CorrelationResponse)
-async def calculate_correlation(request: CorrelationRequest):
+@app.post(
+    "/analytics/correlation",
+    response_model=CorrelationResponse,
+    dependencies=[
+        Depends(correlation_conditional),
+        Depends(admission_guard("correlation")),
+        Depends(profiling_guard("correlation"))
+    ]
+)
+async def calculate_correlation(
+    request: CorrelationRequest,
+    response: Response,
+    etag_key: Optional[str] = Depends(correlation_conditional),
+    if_none_match: Optional[str] = Header(default=None)
+):
     """
     Calculate correlations between operational metrics and revenue.
     Fetches real data from .NET API and performs correlation analysis.
     """
+    # If the fetch fails the response is demo data, which never gets an ETag
+    data = await analytics_service.fetch_restaurant_data(request.restaurant_id)
+    etag = data_etag(etag_key, data) if data is not None else None
+    check_not_modified(etag, if_none_match)
+    
     try:
-        # Fetch real data for the restaurant and calculate correlations with revenue
-        correlations = await analytics_service.calculate_revenue_correlations(
-            request.restaurant_id,
-            request.metrics or ["prep_time", "table_turnover", "order_accuracy", "customer_satisfaction", "wait_time"],
+        # Run the analysis off the event loop so queued requests keep moving
+        correlations, synthetic = await run_in_threadpool(
+            analytics_service.calculate_revenue_correlations,
+            data,
+            request.metrics or DEFAULT_METRICS,
             request.correlation_type
         )
         
+        if not synthetic:
+            set_etag(response, etag)
+        
         return CorrelationResponse(
             restaurant_id=request.restaurant_id,
             correlations=correlations,
             total_data_points=len(correlations),
+            synthetic=synthetic,
             analysis_timestamp=datetime.utcnow()
         )
     except Exception as e:
@@ -70,14 +256,78 @@ async def calculate_correlation(request: CorrelationRequest):
         )
 
 
-@app.post("/analytics/forecast", response_model=ForecastResponse)
-async def forecast_revenue(request: ForecastRequest):
+@app.post(
+    "/analytics/correlation/lagged",
+    response_model=LaggedCorrelationResponse,
+    dependencies=[
+        Depends(lagged_correlation_conditional),
+        Depends(admission_guard("lagged_correlation")),
+        Depends(profiling_guard("lagged_correlation"))
+    ]
+)
+async def calculate_lagged_correlation(
+    request: LaggedCorrelationRequest,
+    response: Response,
+    etag_key: Optional[str] = Depends(lagged_correlation_conditional),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    Cross-correlate operational metrics with revenue over a range of day lags.
+    A positive lag k pairs each metric value with revenue k days later, so the
+    best lag per metric shows how far ahead it predicts revenue.
+    """
+    data = await analytics_service.fetch_restaurant_data(request.restaurant_id)
+    etag = data_etag(etag_key, data) if data is not None else None
+    check_not_modified(etag, if_none_match)
+    
+    try:
+        profiles, total_days, synthetic = await run_in_threadpool(
+            analytics_service.calculate_lagged_revenue_correlations,
+            data,
+            request.metrics or DEFAULT_METRICS,
+            request.min_lag,
+            request.max_lag
+        )
+        
+        if not synthetic:
+            set_etag(response, etag)
+        
+        return LaggedCorrelationResponse(
+            restaurant_id=request.restaurant_id,
+            profiles=profiles,
+            total_days=total_days,
+            synthetic=synthetic,
+            analysis_timestamp=datetime.utcnow()
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Lagged correlation analysis failed: {str(e)}"
+        )
+
+
+@app.post(
+    "/analytics/forecast",
+    response_model=ForecastResponse,
+    dependencies=[
+        Depends(forecast_conditional),
+        Depends(admission_guard("forecast")),
+        Depends(profiling_guard("forecast"))
+    ]
+)
+async def forecast_revenue(
+    request: ForecastRequest,
+    response: Response,
+    etag_key: Optional[str] = Depends(forecast_conditional)
+):
     """
     Generate revenue forecasts using linear trend analysis.
     Provides predictions with confidence intervals.
     """
     try:
-        forecast_points, accuracy, trend = analytics_service.forecast_revenue(
+        # Run the model fit off the event loop so queued requests keep moving
+        forecast_points, accuracy, trend = await run_in_threadpool(
+            analytics_service.forecast_revenue,
             request.historical_data,
             request.forecast_days
         )
@@ -88,6 +338,9 @@ async def forecast_revenue(request: ForecastRequest):
                 detail="Insufficient data for forecasting. Need at least 7 days of historical data."
             )
         
+        # Forecasts only depend on the request body, which the ETag covers
+        set_etag(response, data_etag(etag_key))
+        
         return ForecastResponse(
             restaurant_id=request.restaurant_id,
             forecast_points=forecast_points,
@@ -101,4 +354,74 @@ async def forecast_revenue(request: ForecastRequest):
         raise HTTPException(
             status_code=500,
             detail=f"Forecasting failed: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+# Metric Ingestion and Anomaly Endpoints
+@app.post("/metrics/ingest", response_model=MetricIngestResponse)
+async def ingest_metrics(request: MetricIngestRequest):
+    """
+    Ingest metric points and update the streaming anomaly detectors.
+    Updates the similarity index and bumps the data version of every restaurant in the batch.
+    Returns any anomalies detected in this batch.
+    """
+    anomalies = anomaly_detector.ingest(request.points)
+    similarity_index.ingest(request.points)
+    db.bump_data_versions(point.restaurant_id for point in request.points)
+    return MetricIngestResponse(accepted=len(request.points), anomalies=anomalies)
+
+
+@app.get("/anomalies", response_model=AnomalyListResponse)
+async def list_anomalies(
+    since_id: int = 0,
+    restaurant_id: Optional[int] = None,
+    metric_name: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    wait: float = Query(default=0.0, ge=0.0, le=30.0)
+):
+    """
+    List buffered anomaly events newer than since_id.
+    With wait > 0 the request long-polls until a matching event arrives or wait seconds pass.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        last_event_id = anomaly_detector.last_event_id
+        events = anomaly_detector.get_events(since_id, restaurant_id, metric_name, limit)
+        remaining = deadline - time.monotonic()
+        if events or remaining <= 0:
+            break
+        # Wake on any new event, then re-check the filters
+        await anomaly_detector.wait_for_events(max(since_id, last_event_id), remaining)
+    
+    return AnomalyListResponse(
+        events=events,
+        last_event_id=events[-1].id if events else max(since_id, last_event_id)
+    )
+
+
+# Similarity Search Endpoints
+@app.get("/restaurants/{restaurant_id}/similar", response_model=SimilarRestaurantsResponse)
+async def find_similar_restaurants(
+    restaurant_id: int,
+    k: int = Query(default=5, ge=1, le=100),
+    metric: Literal["cosine", "euclidean"] = "cosine",
+    approximate: bool = False
+):
+    """
+    Find the restaurants whose prep_time, wait_time, customer_satisfaction and
+    revenue curves behave most like this one, based on ingested metrics.
+    """
+    neighbors = similarity_index.query(restaurant_id, k, metric, approximate)
+    if neighbors is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Restaurant {restaurant_id} has no indexed metric profile yet"
+        )
+    
+    return SimilarRestaurantsResponse(
+        restaurant_id=restaurant_id,
+        metric=metric,
+        approximate=approximate,
+        neighbors=neighbors,
+        indexed_restaurants=len(similarity_index)
+    )
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, Literal, List, Dict, Any
 from enum import Enum
 from datetime import datetime
@@ -36,6 +36,45 @@ class CorrelationResponse(BaseModel):
     restaurant_id: int
     correlations: List[CorrelationPair]
     total_data_points: int
+    synthetic: bool = False  # True when demo data was used because real data was unavailable
+    analysis_timestamp: datetime
+
+
+class LaggedCorrelationRequest(BaseModel):
+    restaurant_id: int
+    metrics: Optional[List[str]] = None  # List of metric names to correlate with future revenue
+    min_lag: int = Field(default=0, ge=-90, le=90)  # Days; negative lags mean revenue leads the metric
+    max_lag: int = Field(default=14, ge=-90, le=90)
+
+    @model_validator(mode="after")
+    def check_lag_range(self):
+        if self.min_lag > self.max_lag:
+            raise ValueError("min_lag must not be greater than max_lag")
+        return self
+
+
+class LagCorrelation(BaseModel):
+    lag_days: int
+    correlation_coefficient: float
+    p_value: float
+    data_points: int
+
+
+class MetricLagProfile(BaseModel):
+    metric: str
+    lags: List[LagCorrelation]
+    best_lag_days: int
+    best_correlation_coefficient: float
+    best_p_value: float
+    strength: str
+    significant: bool
+
+
+class LaggedCorrelationResponse(BaseModel):
+    restaurant_id: int
+    profiles: List[MetricLagProfile]
+    total_days: int
+    synthetic: bool  # True when the .NET API was unavailable and demo data was used
     analysis_timestamp: datetime
 
 
@@ -59,4 +98,110 @@ class ForecastResponse(BaseModel):
     forecast_points: List[ForecastPoint]
     model_accuracy: float
     trend_direction: str  # "up", "down", "stable"
-    analysis_timestamp: datetime
\ No newline at end of file
+    analysis_timestamp: datetime
+
+# Metric Ingestion and Anomaly Detection Models
+
+class MetricPoint(BaseModel):
+    restaurant_id: int
+    metric_name: str
+    timestamp: datetime
+    value: float
+
+
+class MetricIngestRequest(BaseModel):
+    points: List[MetricPoint]
+
+
+class AnomalyEvent(BaseModel):
+    id: int
+    restaurant_id: int
+    metric_name: str
+    timestamp: datetime
+    value: float
+    expected_value: float
+    z_score: float
+    direction: str  # "spike", "drop"
+    detected_at: datetime
+
+
+class MetricIngestResponse(BaseModel):
+    accepted: int
+    anomalies: List[AnomalyEvent]
+
+
+class AnomalyListResponse(BaseModel):
+    events: List[AnomalyEvent]
+    last_event_id: int
+
+
+# Similarity Search Models
+
+class SimilarRestaurant(BaseModel):
+    restaurant_id: int
+    similarity: float  # Cosine similarity of the feature vectors
+    distance: float  # Euclidean distance of the feature vectors
+
+
+class SimilarRestaurantsResponse(BaseModel):
+    restaurant_id: int
+    metric: Literal["cosine", "euclidean"]
+    approximate: bool
+    neighbors: List[SimilarRestaurant]
+    indexed_restaurants: int
+
+
+# Admission Control Models
+
+class AdmissionGauge(BaseModel):
+    endpoint: str
+    in_flight: int
+    in_flight_interactive: int
+    in_flight_batch: int
+    queued: int
+    queued_interactive: int
+    queued_batch: int
+    max_concurrent: int
+    max_queue: int
+    admitted_total: int
+    rejected_total: int
+
+
+class AdmissionStatsResponse(BaseModel):
+    endpoints: List[AdmissionGauge]
+    timestamp: datetime
+
+
+# Profiling Models
+
+class ProfileNode(BaseModel):
+    function: str
+    filename: str
+    line: int
+    samples: int
+    wall_ms: float
+    cpu_ms: Optional[float] = None  # None when per-thread CPU clocks are unavailable
+    children: List["ProfileNode"] = []
+
+
+class AllocationStat(BaseModel):
+    location: str
+    size_kb: float
+    count: int
+
+
+class ProfileSummary(BaseModel):
+    id: int
+    endpoint: str
+    restaurant_id: Optional[int] = None
+    started_at: datetime
+    wall_ms: float
+    cpu_ms: Optional[float] = None  # None for async calls, which share the event loop thread
+    samples: int
+    peak_memory_kb: Optional[float] = None  # None when another profile was tracing memory
+
+
+class ProfileRecord(ProfileSummary):
+    calls: List[str]
+    call_tree: ProfileNode
+    allocations: List[AllocationStat]
@@ -0,0 +1,329 @@
+"""
+On-demand sampling profiler for analytics requests.
+
+A profiling session is opened per request when the client asks for it (or a
+random sample of requests is chosen). While it is open, AnalyticsService calls
+decorated with `profiled` register their thread and a background thread
+samples those stacks into a call tree with wall and CPU time. tracemalloc
+runs for the lifetime of the session to summarise allocations. Finished
+profiles go into a bounded ring buffer.
+
+tracemalloc is process-wide, so only one session traces memory at a time;
+sessions that overlap it report no allocation summary. CPU time is not
+reported for async calls because their thread is the shared event loop.
+
+When no session is active a decorated call costs one context variable lookup.
+"""
+import functools
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from itertools import count
+from typing import Deque, Dict, List, Optional
+from models import AllocationStat, ProfileNode, ProfileRecord, ProfileSummary
+
+_active_session: ContextVar[Optional["ProfileSession"]] = ContextVar("active_profile_session", default=None)
+
+
+def _thread_cpu_clock(thread_id: int) -> Optional[int]:
+    try:
+        return time.pthread_getcpuclockid(thread_id)
+    except (AttributeError, OSError):
+        return None  # Per-thread CPU clocks are not available on this platform
+
+
+class _Node:
+    __slots__ = ("function", "filename", "line", "samples", "wall", "cpu", "children")
+
+    def __init__(self, function: str, filename: str, line: int):
+        self.function = function
+        self.filename = filename
+        self.line = line
+        self.samples = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.children: Dict[tuple, "_Node"] = {}
+
+    def child(self, function: str, filename: str, line: int) -> "_Node":
+        key = (function, filename, line)
+        node = self.children.get(key)
+        if node is None:
+            node = self.children[key] = _Node(function, filename, line)
+        return node
+
+    def to_model(self, has_cpu: bool) -> ProfileNode:
+        children = sorted(self.children.values(), key=lambda node: node.wall, reverse=True)
+        return ProfileNode(
+            function=self.function,
+            filename=self.filename,
+            line=self.line,
+            samples=self.samples,
+            wall_ms=round(self.wall * 1000, 3),
+            cpu_ms=round(self.cpu * 1000, 3) if has_cpu else None,
+            children=[child.to_model(has_cpu) for child in children]
+        )
+
+
+class ProfileSession:
+    """Samples the threads running profiled calls for one request"""
+
+    def __init__(self, profile_id: int, endpoint: str, interval: float):
+        self.profile_id = profile_id
+        self.endpoint = endpoint
+        self.restaurant_id: Optional[int] = None
+        self.interval = interval
+        self.started_at = datetime.utcnow()
+        self.calls: List[str] = []
+        self.token = None
+        self.traces_memory = False
+        self._anchors: Dict[int, object] = {}  # thread id -> frame of the outermost profiled call
+        self._cpu_clocks: Dict[int, Optional[int]] = {}
+        self._lock = threading.Lock()
+        self._root = _Node("<request>", "", 0)
+        self._has_cpu = True
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{profile_id}", daemon=True)
+        self._start_wall = time.perf_counter()
+        self._wall = 0.0
+
+    def start(self) -> None:
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._sampler.join()
+        self._wall = time.perf_counter() - self._start_wall
+
+    def enter(self, name: str, frame, on_event_loop: bool = False) -> bool:
+        """Register the calling thread; returns False if it is already registered"""
+        thread_id = threading.get_ident()
+        with self._lock:
+            self.calls.append(name)
+            if thread_id in self._anchors:
+                return False
+            self._anchors[thread_id] = frame
+            if on_event_loop:
+                # The loop thread's CPU clock also counts unrelated concurrent requests
+                self._has_cpu = False
+                self._cpu_clocks[thread_id] = None
+            elif thread_id not in self._cpu_clocks:
+                self._cpu_clocks[thread_id] = _thread_cpu_clock(thread_id)
+            return True
+
+    def exit(self) -> None:
+        with self._lock:
+            self._anchors.pop(threading.get_ident(), None)
+
+    def _run(self) -> None:
+        last_wall = time.perf_counter()
+        last_cpu: Dict[int, float] = {}
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last_wall = now - last_wall, now
+            frames = sys._current_frames()
+            with self._lock:
+                anchors = dict(self._anchors)
+                clocks = dict(self._cpu_clocks)
+            for thread_id, anchor in anchors.items():
+                cpu = self._cpu_delta(thread_id, clocks.get(thread_id), last_cpu)
+                self._record(frames.get(thread_id), anchor, elapsed, cpu)
+
+    def _cpu_delta(self, thread_id: int, clock: Optional[int], last_cpu: Dict[int, float]) -> float:
+        if clock is None:
+            self._has_cpu = False
+            return 0.0
+        try:
+            now = time.clock_gettime(clock)
+        except OSError:
+            return 0.0
+        previous = last_cpu.get(thread_id, now)
+        last_cpu[thread_id] = now
+        return now - previous
+
+    def _record(self, frame, anchor, wall: float, cpu: float) -> None:
+        stack = []
+        while frame is not None:
+            stack.append(frame)
+            if frame is anchor:
+                break
+            frame = frame.f_back
+        else:
+            # The profiled coroutine is suspended, e.g. awaiting I/O
+            stack = None
+
+        node = self._root
+        node.samples += 1
+        node.wall += wall
+        node.cpu += cpu
+        if stack is None:
+            node = node.child("<suspended>", "", 0)
+            node.samples += 1
+            node.wall += wall
+            node.cpu += cpu
+            return
+        for frame in reversed(stack):
+            code = frame.f_code
+            node = node.child(code.co_name, code.co_filename, code.co_firstlineno)
+            node.samples += 1
+            node.wall += wall
+            node.cpu += cpu
+
+    def to_record(self, allocations: List[AllocationStat], peak_memory: Optional[int]) -> ProfileRecord:
+        return ProfileRecord(
+            id=self.profile_id,
+            endpoint=self.endpoint,
+            restaurant_id=self.restaurant_id,
+            started_at=self.started_at,
+            wall_ms=round(self._wall * 1000, 3),
+            cpu_ms=round(self._root.cpu * 1000, 3) if self._has_cpu else None,
+            samples=self._root.samples,
+            peak_memory_kb=round(peak_memory / 1024, 1) if peak_memory is not None else None,
+            calls=self.calls,
+            call_tree=self._root.to_model(self._has_cpu),
+            allocations=allocations
+        )
+
+
+class RequestProfiler:
+    """Decides which requests are profiled and keeps the most recent profiles"""
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        interval: float = 0.005,
+        buffer_size: int = 50,
+        top_allocations: int = 10
+    ):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.top_allocations = top_allocations
+        self._profiles: Deque[ProfileRecord] = deque(maxlen=buffer_size)
+        self._ids = count(1)
+        self._lock = threading.Lock()
+        self._tracing_owner: Optional[int] = None  # Id of the session tracing memory
+        self._started_tracing = False
+
+    @classmethod
+    def from_env(cls) -> "RequestProfiler":
+        """Read PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS and PROFILE_BUFFER_SIZE"""
+        return cls(
+            sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0.0)),
+            interval=float(os.environ.get("PROFILE_INTERVAL_MS", 5)) / 1000,
+            buffer_size=int(os.environ.get("PROFILE_BUFFER_SIZE", 50)),
+        )
+
+    def should_profile(self, requested: bool) -> bool:
+        return requested or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self, endpoint: str) -> ProfileSession:
+        """Open a session and make it the active one for the current context"""
+        session = ProfileSession(next(self._ids), endpoint, self.interval)
+        session.traces_memory = self._start_tracing(session.profile_id)
+        session.start()
+        session.token = _active_session.set(session)
+        return session
+
+    def detach(self, session: ProfileSession) -> None:
+        """Stop profiling calls made from the current context"""
+        if session.token is None:
+            return
+        try:
+            _active_session.reset(session.token)
+        except ValueError:
+            _active_session.set(None)  # Detached from a different context than it started in
+        session.token = None
+
+    def finish(self, session: ProfileSession) -> ProfileRecord:
+        """Close a session and store its profile.
+
+        Joins the sampler thread and takes the tracemalloc snapshot, so async
+        callers should detach first and run this in a worker thread."""
+        self.detach(session)
+        session.stop()
+        allocations, peak_memory = self._stop_tracing() if session.traces_memory else ([], None)
+        record = session.to_record(allocations, peak_memory)
+        with self._lock:
+            self._profiles.append(record)
+        return record
+
+    def list_profiles(self) -> List[ProfileSummary]:
+        with self._lock:
+            profiles = list(self._profiles)
+        return [ProfileSummary(**record.model_dump(include=set(ProfileSummary.model_fields))) for record in reversed(profiles)]
+
+    def get_profile(self, profile_id: int) -> Optional[ProfileRecord]:
+        with self._lock:
+            return next((record for record in self._profiles if record.id == profile_id), None)
+
+    def _start_tracing(self, profile_id: int) -> bool:
+        """Claim tracemalloc for a session; returns False if another session holds it"""
+        with self._lock:
+            if self._tracing_owner is not None:
+                return False
+            self._tracing_owner = profile_id
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+            return True
+
+    def _stop_tracing(self):
+        with self._lock:
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ])
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            self._tracing_owner = None
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+        allocations = [
+            AllocationStat(
+                location=f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                size_kb=round(stat.size / 1024, 1),
+                count=stat.count
+            )
+            for stat in snapshot.statistics("lineno")[:self.top_allocations]
+        ]
+        return allocations, peak_memory
+
+
+def profiled(func):
+    """Sample this call when it runs inside an active profiling session"""
+    name = func.__qualname__
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            session = _active_session.get()
+            if session is None:
+                return await func(*args, **kwargs)
+            registered = session.enter(name, sys._getframe(), on_event_loop=True)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                if registered:
+                    session.exit()
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        session = _active_session.get()
+        if session is None:
+            return func(*args, **kwargs)
+        registered = session.enter(name, sys._getframe())
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if registered:
+                session.exit()
+    return wrapper
@@ -0,0 +1,230 @@
+"""
+Cross-restaurant similarity search over metric profiles.
+
+Each restaurant is described by the daily curves of a few channels over its
+most recent window of days. Every curve is interpolated onto the fixed window and
+z-normalized, so restaurants are compared by the shape of their curves rather
+than by scale, and the concatenated vectors are kept as rows of one contiguous
+matrix. A top-k query is a single matrix-vector product; the optional
+approximate mode first ranks a random projection of the rows and only scores
+the best candidates exactly.
+"""
+import threading
+from typing import Dict, List, Optional, Sequence, Set
+import numpy as np
+from models import MetricPoint, SimilarRestaurant
+
+DEFAULT_CHANNELS = ("prep_time", "wait_time", "customer_satisfaction", "revenue")
+CHANNEL_ALIASES = {"totalRevenue": "revenue", "total_revenue": "revenue"}
+
+
+class SimilarityIndex:
+    """Incrementally maintained matrix of per-restaurant feature vectors"""
+
+    def __init__(
+        self,
+        channels: Sequence[str] = DEFAULT_CHANNELS,
+        window_days: int = 28,
+        min_days: int = 7,
+        projection_dims: int = 32,
+        seed: int = 0
+    ):
+        self.channels = tuple(channels)
+        self.window_days = window_days
+        self.min_days = min_days  # Days a channel needs before it contributes to the vector
+        self.dimension = len(self.channels) * window_days
+        self._lock = threading.Lock()
+
+        # Daily [sum, count] per restaurant and channel, limited to the window
+        self._daily: Dict[int, Dict[str, Dict[int, List[float]]]] = {}
+        self._latest_day: Dict[int, int] = {}
+        self._dirty: Set[int] = set()
+
+        self._rows: Dict[int, int] = {}  # restaurant id -> matrix row
+        self._ids = np.empty(0, dtype=np.int64)
+        self._matrix = np.empty((0, self.dimension), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+
+        rng = np.random.default_rng(seed)
+        self._projection = (rng.normal(size=(self.dimension, projection_dims)) / np.sqrt(projection_dims)).astype(np.float32)
+        self._projected = np.empty((0, projection_dims), dtype=np.float32)
+        self._projected_norms = np.empty(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._rebuild_dirty()
+            return len(self._rows)
+
+    def ingest(self, points: List[MetricPoint]) -> None:
+        """Fold new points into the daily aggregates; vectors are rebuilt on the next query"""
+        with self._lock:
+            for point in points:
+                channel = CHANNEL_ALIASES.get(point.metric_name, point.metric_name)
+                if channel not in self.channels:
+                    continue
+
+                restaurant_id = point.restaurant_id
+                day = point.timestamp.date().toordinal()
+                latest = self._latest_day.get(restaurant_id)
+                if latest is not None and day <= latest - self.window_days:
+                    continue  # Too old to affect the current window
+                if latest is None or day > latest:
+                    self._latest_day[restaurant_id] = day
+
+                days = self._daily.setdefault(restaurant_id, {}).setdefault(channel, {})
+                totals = days.get(day)
+                if totals is None:
+                    days[day] = [point.value, 1]
+                else:
+                    totals[0] += point.value
+                    totals[1] += 1
+                self._dirty.add(restaurant_id)
+
+    def query(
+        self,
+        restaurant_id: int,
+        k: int = 5,
+        metric: str = "cosine",
+        approximate: bool = False,
+        candidates: int = 64
+    ) -> Optional[List[SimilarRestaurant]]:
+        """Top-k most similar restaurants, or None if the restaurant is not indexed"""
+        with self._lock:
+            self._rebuild_dirty()
+            row = self._rows.get(restaurant_id)
+            if row is None:
+                return None
+
+            size = len(self._rows)
+            query_vector = self._matrix[row]
+
+            # Keep enough candidates that pruning never truncates the top k
+            candidates = max(candidates, 4 * (k + 1))
+            if approximate and size > candidates:
+                # Coarse ranking in the projected space, exact scoring of the survivors only
+                projected, projected_norms = self._projected[:size], self._projected_norms[:size]
+                query_projected = query_vector @ self._projection
+                projected_dots = projected @ query_projected
+                if metric == "cosine":
+                    # Projected cosine up to the constant query norm
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        coarse = np.where(projected_norms > 0, -projected_dots / projected_norms, 0.0)
+                else:
+                    # Squared projected distance without the constant query term
+                    coarse = projected_norms ** 2 - 2 * projected_dots
+                pool = np.argpartition(coarse, candidates)[:candidates]
+                pool = pool[pool != row]
+                vectors, sq_norms = self._matrix[pool], self._sq_norms[pool]
+            else:
+                pool = np.arange(size)
+                vectors, sq_norms = self._matrix[:size], self._sq_norms[:size]
+
+            dots = vectors @ query_vector
+            query_sq_norm = self._sq_norms[row]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                similarity = np.where(
+                    sq_norms * query_sq_norm > 0,
+                    dots / np.sqrt(sq_norms * query_sq_norm),
+                    0.0
+                )
+            distance = np.sqrt(np.maximum(sq_norms + query_sq_norm - 2 * dots, 0.0))
+
+            order_key = -similarity if metric == "cosine" else distance.copy()
+            # The restaurant itself is never its own neighbour
+            order_key[pool == row] = np.inf
+            k = min(k, len(pool) - int((pool == row).any()))
+            if k <= 0:
+                return []
+            top = np.argpartition(order_key, k - 1)[:k]
+            top = top[np.argsort(order_key[top])]
+
+            return [
+                SimilarRestaurant(
+                    restaurant_id=int(self._ids[pool[i]]),
+                    similarity=float(similarity[i]),
+                    distance=float(distance[i])
+                )
+                for i in top
+            ]
+
+    def _rebuild_dirty(self) -> None:
+        for restaurant_id in self._dirty:
+            vector = self._feature_vector(restaurant_id)
+            if vector is not None:
+                self._set_row(restaurant_id, vector)
+            else:
+                self._remove_row(restaurant_id)
+        self._dirty.clear()
+
+    def _feature_vector(self, restaurant_id: int) -> Optional[np.ndarray]:
+        """Concatenate the z-normalized daily curve of each channel over the window"""
+        latest = self._latest_day[restaurant_id]
+        start = latest - self.window_days + 1
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        has_data = False
+
+        for offset, channel in enumerate(self.channels):
+            days = self._daily[restaurant_id].get(channel)
+            if not days:
+                continue
+            # Drop days that have slid out of the window
+            for day in [day for day in days if day < start]:
+                del days[day]
+            if len(days) < self.min_days:
+                continue
+
+            observed_days = sorted(days)
+            observed = np.array(observed_days, dtype=np.int64)
+            means = np.array([days[day][0] / days[day][1] for day in observed_days])
+            # Fill missing days by interpolating between observed ones
+            curve = np.interp(np.arange(start, latest + 1), observed, means)
+            std = curve.std()
+            if std > 0:
+                vector[offset * self.window_days:(offset + 1) * self.window_days] = (curve - curve.mean()) / std
+            has_data = True
+
+        return vector if has_data else None
+
+    def _set_row(self, restaurant_id: int, vector: np.ndarray) -> None:
+        row = self._rows.get(restaurant_id)
+        if row is None:
+            row = len(self._rows)
+            if row == len(self._matrix):
+                self._grow(max(16, 2 * row))
+            self._rows[restaurant_id] = row
+            self._ids[row] = restaurant_id
+
+        self._matrix[row] = vector
+        self._sq_norms[row] = vector @ vector
+        self._projected[row] = vector @ self._projection
+        self._projected_norms[row] = np.linalg.norm(self._projected[row])
+
+    def _remove_row(self, restaurant_id: int) -> None:
+        """Drop a restaurant whose window no longer has enough data, moving the last row into its place"""
+        row = self._rows.pop(restaurant_id, None)
+        if row is None:
+            return
+        last = len(self._rows)
+        if row != last:
+            moved = int(self._ids[last])
+            self._rows[moved] = row
+            self._ids[row] = moved
+            self._matrix[row] = self._matrix[last]
+            self._sq_norms[row] = self._sq_norms[last]
+            self._projected[row] = self._projected[last]
+            self._projected_norms[row] = self._projected_norms[last]
+
+    def _grow(self, capacity: int) -> None:
+        """Double the backing arrays so appends stay amortized O(1)"""
+        size = len(self._rows)
+
+        def grown(array: np.ndarray) -> np.ndarray:
+            new = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            new[:size] = array[:size]
+            return new
+
+        self._ids = grown(self._ids)
+        self._matrix = grown(self._matrix)
+        self._sq_norms = grown(self._sq_norms)
+        self._projected = grown(self._projected)
+        self._projected_norms = grown(self._projected_norms)
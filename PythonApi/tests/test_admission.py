@@ -0,0 +1,121 @@
+import pytest
+import asyncio
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from admission import AdmissionLimits, AdmissionRejected, EndpointGate, Priority
+
+
+class TestEndpointGate:
+    """Unit tests for the per-endpoint admission gate"""
+    
+    def test_parse_priority(self):
+        """Test that unknown or missing headers default to interactive"""
+        assert Priority.parse("batch") == Priority.BATCH
+        assert Priority.parse(" Batch ") == Priority.BATCH
+        assert Priority.parse(None) == Priority.INTERACTIVE
+        assert Priority.parse("anything") == Priority.INTERACTIVE
+    
+    def test_rejects_when_queue_full(self):
+        """Test that a full queue fails fast instead of waiting"""
+        async def scenario():
+            gate = EndpointGate("test", AdmissionLimits(max_concurrent=1, max_queue=0))
+            await gate.acquire(Priority.INTERACTIVE)
+            with pytest.raises(AdmissionRejected) as exc_info:
+                await gate.acquire(Priority.INTERACTIVE)
+            assert exc_info.value.reason == "queue full"
+            assert gate.snapshot()["rejected_total"] == 1
+        
+        asyncio.run(scenario())
+    
+    def test_queue_timeout(self):
+        """Test that waiters give up after the queue timeout"""
+        async def scenario():
+            gate = EndpointGate("test", AdmissionLimits(max_concurrent=1, queue_timeout=0.01))
+            await gate.acquire(Priority.INTERACTIVE)
+            with pytest.raises(AdmissionRejected):
+                await gate.acquire(Priority.INTERACTIVE)
+            assert gate.queued == 0
+        
+        asyncio.run(scenario())
+    
+    def test_interactive_served_before_batch(self):
+        """Test that released slots go to interactive waiters first"""
+        async def scenario():
+            gate = EndpointGate("test", AdmissionLimits(max_concurrent=1, batch_max_concurrent=1))
+            await gate.acquire(Priority.INTERACTIVE)
+            order = []
+            
+            async def request(priority):
+                await gate.acquire(priority)
+                order.append(priority)
+                gate.release(priority)
+            
+            batch = asyncio.create_task(request(Priority.BATCH))
+            await asyncio.sleep(0)
+            interactive = asyncio.create_task(request(Priority.INTERACTIVE))
+            await asyncio.sleep(0)
+            assert gate.queued == 2
+            
+            gate.release(Priority.INTERACTIVE)
+            await asyncio.gather(batch, interactive)
+            assert order == [Priority.INTERACTIVE, Priority.BATCH]
+            assert gate.in_flight == 0
+        
+        asyncio.run(scenario())
+    
+    def test_batch_limited_to_its_share(self):
+        """Test that batch traffic cannot take every slot"""
+        async def scenario():
+            gate = EndpointGate("test", AdmissionLimits(
+                max_concurrent=2, batch_max_concurrent=1, queue_timeout=0.01
+            ))
+            await gate.acquire(Priority.BATCH)
+            with pytest.raises(AdmissionRejected):
+                await gate.acquire(Priority.BATCH)
+            await gate.acquire(Priority.INTERACTIVE)
+            assert gate.in_flight == 2
+        
+        asyncio.run(scenario())
+    
+    def test_interactive_displaces_batch_waiter(self):
+        """Test that a full queue makes room for interactive requests"""
+        async def scenario():
+            gate = EndpointGate("test", AdmissionLimits(max_concurrent=1, max_queue=1))
+            await gate.acquire(Priority.INTERACTIVE)
+            batch = asyncio.create_task(gate.acquire(Priority.BATCH))
+            await asyncio.sleep(0)
+            interactive = asyncio.create_task(gate.acquire(Priority.INTERACTIVE))
+            await asyncio.sleep(0)
+            
+            with pytest.raises(AdmissionRejected):
+                await batch
+            gate.release(Priority.INTERACTIVE)
+            await interactive
+            assert gate.in_flight == 1
+        
+        asyncio.run(scenario())
+    
+    def test_slot_granted_at_deadline_is_kept(self, monkeypatch):
+        """Test that a slot handed over as the queue timeout fires is not leaked"""
+        async def scenario():
+            gate = EndpointGate("test", AdmissionLimits(max_concurrent=1))
+            await gate.acquire(Priority.INTERACTIVE)
+            
+            async def wait_for_racing_release(future, timeout):
+                # The slot is granted and the deadline fires in the same iteration
+                gate.release(Priority.INTERACTIVE)
+                assert future.done()
+                raise asyncio.TimeoutError()
+            
+            monkeypatch.setattr(asyncio, "wait_for", wait_for_racing_release)
+            await gate.acquire(Priority.INTERACTIVE)
+            monkeypatch.undo()
+            
+            assert gate.in_flight == 1
+            assert gate.snapshot()["rejected_total"] == 0
+            gate.release(Priority.INTERACTIVE)
+            assert gate.in_flight == 0
+        
+        asyncio.run(scenario())
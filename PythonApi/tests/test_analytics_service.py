@@ -0,0 +1,158 @@
+import pytest
+import asyncio
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from analytics_service import AnalyticsService
+
+
+class TestLaggedCorrelations:
+    """Unit tests for the FFT-based lagged cross-correlation"""
+    
+    def setup_method(self):
+        """Create a fresh service instance for each test"""
+        self.service = AnalyticsService()
+    
+    def test_matches_pearson_for_every_lag(self):
+        """Test that the FFT scan agrees with one pearsonr call per lag"""
+        rng = np.random.default_rng(0)
+        values = rng.normal(size=(60, 2))
+        target = rng.normal(size=60)
+        lags = np.arange(-5, 15)
+        
+        coefficients, overlaps = AnalyticsService._lagged_pearson(values, target, lags)
+        
+        assert overlaps[:, 0].tolist() == (60 - np.abs(lags)).tolist()
+        for i, lag in enumerate(lags):
+            for col in range(values.shape[1]):
+                if lag >= 0:
+                    x, y = values[:60 - lag, col], target[lag:]
+                else:
+                    x, y = values[-lag:, col], target[:60 + lag]
+                expected, _ = stats.pearsonr(x, y)
+                assert coefficients[i, col] == pytest.approx(expected, abs=1e-9)
+    
+    def test_missing_days_are_skipped_pairwise(self):
+        """Test that NaN days are left out of each lag's pairs rather than filled in"""
+        rng = np.random.default_rng(4)
+        values = rng.normal(size=(50, 1))
+        target = rng.normal(size=50)
+        values[rng.choice(50, 15, replace=False), 0] = np.nan
+        target[rng.choice(50, 10, replace=False)] = np.nan
+        lags = np.arange(0, 8)
+        
+        coefficients, overlaps = AnalyticsService._lagged_pearson(values, target, lags)
+        
+        for i, lag in enumerate(lags):
+            x, y = values[:50 - lag, 0], target[lag:]
+            both = ~np.isnan(x) & ~np.isnan(y)
+            expected, _ = stats.pearsonr(x[both], y[both])
+            assert overlaps[i, 0] == both.sum()
+            assert coefficients[i, 0] == pytest.approx(expected, abs=1e-9)
+    
+    def test_sparse_data_is_not_falsely_significant(self):
+        """Test that weekly observations are not inflated into daily data points"""
+        rng = np.random.default_rng(5)
+        dates = pd.date_range("2024-01-01", periods=13, freq="7D")
+        revenue_data = [
+            {"date": str(date.date()), "totalRevenue": float(value)}
+            for date, value in zip(dates, rng.normal(5000, 100, 13))
+        ]
+        metrics_data = [
+            {"timestamp": f"{date.date()}T12:00:00Z", "metricName": "wait_time", "value": float(value)}
+            for date, value in zip(dates, rng.normal(10, 2, 13))
+        ]
+        
+        daily_df = self.service._build_daily_frame(revenue_data, metrics_data)
+        profiles = self.service._calculate_lagged_correlations(daily_df, ["wait_time"], 0, 14)
+        
+        assert len(daily_df) == 85
+        # Only whole-week lags pair real observations, and never more than 13 of them
+        lags = profiles[0].lags
+        assert {point.lag_days for point in lags} <= {0, 7, 14}
+        assert all(point.data_points <= 13 for point in lags)
+        assert not profiles[0].significant
+    
+    def test_best_lag_recovers_lead_time(self):
+        """Test that a metric leading revenue by 4 days is found at lag 4"""
+        rng = np.random.default_rng(1)
+        wait_time = rng.normal(size=90)
+        # Revenue on day t depends on wait_time on day t - 4
+        revenue = np.concatenate([np.full(4, 5000.0), 5000 - 300 * wait_time[:86]]) + rng.normal(0, 10, 90)
+        daily_df = pd.DataFrame(
+            {"wait_time": wait_time, "totalRevenue": revenue},
+            index=pd.date_range("2024-01-01", periods=90, freq="D")
+        )
+        
+        profiles = self.service._calculate_lagged_correlations(daily_df, ["wait_time"], 0, 14)
+        
+        assert len(profiles) == 1
+        assert profiles[0].best_lag_days == 4
+        assert profiles[0].best_correlation_coefficient < -0.9
+        assert profiles[0].significant
+        assert len(profiles[0].lags) == 15
+    
+    def test_skips_lags_without_enough_overlap(self):
+        """Test that lags leaving fewer than 10 points are omitted"""
+        daily_df = self.service._generate_mock_daily_frame(["prep_time"], days=20)
+        profiles = self.service._calculate_lagged_correlations(daily_df, ["prep_time"], 0, 14)
+        assert [point.lag_days for point in profiles[0].lags] == list(range(0, 11))
+    
+    def test_build_daily_frame_marks_missing_days(self):
+        """Test that raw API records become a daily frame with NaN on missing days"""
+        revenue_data = [
+            {"date": "2024-01-01", "totalRevenue": 100.0},
+            {"date": "2024-01-03", "totalRevenue": 300.0},
+        ]
+        metrics_data = [
+            {"timestamp": "2024-01-01T12:00:00Z", "metricName": "wait_time", "value": 10.0},
+            {"timestamp": "2024-01-01T18:00:00Z", "metricName": "wait_time", "value": 20.0},
+            {"timestamp": "2024-01-03T12:00:00Z", "metricName": "wait_time", "value": 30.0},
+        ]
+        
+        daily_df = self.service._build_daily_frame(revenue_data, metrics_data)
+        
+        assert len(daily_df) == 3
+        assert daily_df["wait_time"].tolist()[::2] == [15.0, 30.0]
+        assert daily_df["totalRevenue"].tolist()[::2] == [100.0, 300.0]
+        assert daily_df.iloc[1].isna().all()
+    
+    def test_short_real_history_is_not_replaced(self, monkeypatch):
+        """Test that real data shorter than max_lag + 10 days is still used"""
+        rng = np.random.default_rng(2)
+        revenue_data = [
+            {"date": f"2024-01-{day:02d}", "totalRevenue": float(value)}
+            for day, value in zip(range(1, 31), rng.normal(5000, 100, 30))
+        ]
+        metrics_data = [
+            {"timestamp": f"2024-01-{day:02d}T12:00:00Z", "metricName": "wait_time", "value": float(value)}
+            for day, value in zip(range(1, 31), rng.normal(10, 2, 30))
+        ]
+        
+        async def fetch(restaurant_id, days=90):
+            return revenue_data, metrics_data
+        
+        monkeypatch.setattr(self.service, "_fetch_restaurant_data", fetch)
+        data = asyncio.run(self.service.fetch_restaurant_data(1))
+        profiles, total_days, synthetic = self.service.calculate_lagged_revenue_correlations(data, ["wait_time"], 0, 21)
+        
+        assert not synthetic
+        assert total_days == 30
+        assert [point.lag_days for point in profiles[0].lags] == list(range(0, 21))
+    
+    def test_fetch_failure_is_flagged_synthetic(self, monkeypatch):
+        """Test that mock fallback data is reported as synthetic"""
+        async def fetch(restaurant_id, days=90):
+            raise Exception("API unavailable")
+        
+        monkeypatch.setattr(self.service, "_fetch_restaurant_data", fetch)
+        data = asyncio.run(self.service.fetch_restaurant_data(1))
+        assert data is None
+        profiles, total_days, synthetic = self.service.calculate_lagged_revenue_correlations(data, ["wait_time"], 0, 14)
+        
+        assert synthetic
+        assert profiles[0].metric == "wait_time"
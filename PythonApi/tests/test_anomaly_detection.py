@@ -0,0 +1,95 @@
+import pytest
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from anomaly_detection import AnomalyDetector, EwmaDetector
+from models import MetricPoint
+
+
+def make_points(values, metric_name="prep_time", restaurant_id=1):
+    start = datetime(2024, 1, 1)
+    return [
+        MetricPoint(
+            restaurant_id=restaurant_id,
+            metric_name=metric_name,
+            timestamp=start + timedelta(minutes=i),
+            value=value
+        )
+        for i, value in enumerate(values)
+    ]
+
+
+class TestAnomalyDetector:
+    """Unit tests for the streaming anomaly detector"""
+    
+    def setup_method(self):
+        """Create a fresh detector for each test"""
+        self.detector = AnomalyDetector(alpha=0.2, threshold=3.0, warmup=5, buffer_size=3)
+    
+    def test_ewma_tracks_constant_stream(self):
+        """Test that a constant stream converges with zero variance"""
+        ewma = EwmaDetector(alpha=0.5)
+        for _ in range(5):
+            ewma.update(10.0)
+        assert ewma.mean == pytest.approx(10.0)
+        assert ewma.variance == pytest.approx(0.0)
+    
+    def test_detects_spike_and_drop(self):
+        """Test that large deviations are reported with their direction"""
+        baseline = [10.0, 11.0, 9.0, 10.5, 9.5, 10.0, 10.2, 9.8]
+        anomalies = self.detector.ingest(make_points(baseline + [30.0]))
+        assert len(anomalies) == 1
+        assert anomalies[0].direction == "spike"
+        assert anomalies[0].z_score > 3.0
+        
+        drops = self.detector.ingest(make_points([-20.0]))
+        assert drops[0].direction == "drop"
+    
+    def test_detects_jump_from_flat_baseline(self):
+        """Test that a stream that was constant through warmup still flags a drop"""
+        points = make_points([0.98] * 20 + [0.40], metric_name="order_accuracy")
+        anomalies = self.detector.ingest(points)
+        assert len(anomalies) == 1
+        assert anomalies[0].direction == "drop"
+        assert anomalies[0].expected_value == pytest.approx(0.98)
+    
+    def test_flat_baseline_ignores_small_jitter(self):
+        """Test that the std floor keeps tiny deviations from a flat stream quiet"""
+        points = make_points([0.98] * 20 + [0.981], metric_name="order_accuracy")
+        assert self.detector.ingest(points) == []
+    
+    def test_no_alerts_during_warmup(self):
+        """Test that the baseline is not trusted before warmup"""
+        assert self.detector.ingest(make_points([10.0, 11.0, 50.0])) == []
+    
+    def test_streams_are_independent(self):
+        """Test that restaurants and metrics keep separate baselines"""
+        self.detector.ingest(make_points([10.0, 11.0, 9.0, 10.0, 10.0, 10.0], restaurant_id=1))
+        anomalies = self.detector.ingest(make_points([500.0], restaurant_id=2))
+        assert anomalies == []
+    
+    def test_event_buffer_is_bounded(self):
+        """Test that only the most recent events are kept"""
+        baseline = [10.0, 11.0, 9.0, 10.5, 9.5, 10.0]
+        for metric in ["a", "b", "c", "d"]:
+            self.detector.ingest(make_points(baseline + [100.0], metric_name=metric))
+        
+        events = self.detector.get_events()
+        assert [event.metric_name for event in events] == ["b", "c", "d"]
+        assert self.detector.get_events(since_id=events[-1].id) == []
+        assert [event.metric_name for event in self.detector.get_events(metric_name="c")] == ["c"]
+    
+    def test_wait_for_events_wakes_on_anomaly(self):
+        """Test that long-polling returns as soon as an anomaly is recorded"""
+        async def scenario():
+            self.detector.ingest(make_points([10.0, 11.0, 9.0, 10.5, 9.5, 10.0]))
+            waiter = asyncio.create_task(self.detector.wait_for_events(0, timeout=5.0))
+            await asyncio.sleep(0)
+            assert not waiter.done()
+            self.detector.ingest(make_points([100.0]))
+            await asyncio.wait_for(waiter, timeout=1.0)
+        
+        asyncio.run(scenario())
@@ -4,7 +4,8 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from fastapi.testclient import TestClient
-from main import app
+import main
+from main import app, admission_controller
 from database import db
 
 
@@ -35,4 +36,211 @@ class TestAPI:
         assert response.headers["access-control-allow-origin"] == "*"
         assert "access-control-allow-credentials" in response.headers
     
+    def test_admission_stats(self):
+        """Test that admission gauges are exposed for the analytics endpoints"""
+        response = self.client.get("/admission/stats")
+        assert response.status_code == 200
+        endpoints = {gauge["endpoint"] for gauge in response.json()["endpoints"]}
+        assert {"correlation", "forecast"} <= endpoints
+    
+    def test_overloaded_endpoint_returns_503(self):
+        """Test that a saturated endpoint fails fast with Retry-After"""
+        gate = admission_controller.gate("forecast")
+        max_concurrent, max_queue = gate.limits.max_concurrent, gate.limits.max_queue
+        gate.limits.max_concurrent, gate.limits.max_queue = 0, 0
+        try:
+            response = self.client.post(
+                "/analytics/forecast",
+                json={"restaurant_id": 1, "historical_data": []}
+            )
+        finally:
+            gate.limits.max_concurrent, gate.limits.max_queue = max_concurrent, max_queue
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == str(gate.limits.retry_after)
+    
+    def test_lagged_correlation_rejects_inverted_range(self):
+        """Test that min_lag greater than max_lag fails request validation"""
+        response = self.client.post(
+            "/analytics/correlation/lagged",
+            json={"restaurant_id": 1, "min_lag": 10, "max_lag": 3}
+        )
+        assert response.status_code == 422
+    
+    def test_lagged_correlation_rejects_out_of_range_lag(self):
+        """Test that lags beyond 90 days fail request validation"""
+        response = self.client.post(
+            "/analytics/correlation/lagged",
+            json={"restaurant_id": 1, "min_lag": 0, "max_lag": 365}
+        )
+        assert response.status_code == 422
+    
+    def test_ingest_and_list_anomalies(self):
+        """Test that ingested outliers show up in the anomaly feed"""
+        values = [10.0, 11.0, 9.0, 10.5, 9.5, 10.0, 10.2, 9.8, 10.1, 9.9, 10.0, 80.0]
+        points = [
+            {"restaurant_id": 9001, "metric_name": "prep_time",
+             "timestamp": f"2024-01-01T00:{i:02d}:00", "value": value}
+            for i, value in enumerate(values)
+        ]
+        response = self.client.post("/metrics/ingest", json={"points": points})
+        assert response.status_code == 200
+        assert response.json()["accepted"] == len(values)
+        assert len(response.json()["anomalies"]) == 1
+        
+        response = self.client.get("/anomalies", params={"restaurant_id": 9001})
+        assert response.status_code == 200
+        events = response.json()["events"]
+        assert [event["value"] for event in events] == [80.0]
+        assert response.json()["last_event_id"] == events[-1]["id"]
+    
+    def test_profiled_request(self):
+        """Test that X-Profile captures a profile retrievable from the admin endpoint"""
+        historical_data = [
+            {"date": f"2024-01-{day:02d}", "total_revenue": 1000.0 + 25 * day}
+            for day in range(1, 15)
+        ]
+        response = self.client.post(
+            "/analytics/forecast",
+            json={"restaurant_id": 7, "historical_data": historical_data},
+            headers={"X-Profile": "true"}
+        )
+        assert response.status_code == 200
+        profile_id = response.headers["x-profile-id"]
+        
+        response = self.client.get(f"/admin/profiles/{profile_id}")
+        assert response.status_code == 200
+        assert response.json()["restaurant_id"] == 7
+        assert response.json()["calls"] == ["AnalyticsService.forecast_revenue"]
+    
+    def test_missing_profile_returns_404(self):
+        """Test that unknown profile ids are not found"""
+        response = self.client.get("/admin/profiles/999999")
+        assert response.status_code == 404
+    
+    def test_conditional_forecast_request(self):
+        """Test that a matching If-None-Match returns 304 until new data is ingested"""
+        body = {
+            "restaurant_id": 8,
+            "historical_data": [
+                {"date": f"2024-01-{day:02d}", "total_revenue": 1000.0 + 25 * day}
+                for day in range(1, 15)
+            ]
+        }
+        response = self.client.post("/analytics/forecast", json=body)
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        
+        response = self.client.post("/analytics/forecast", json=body, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+        
+        body["forecast_days"] = 7
+        response = self.client.post("/analytics/forecast", json=body, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        
+        self.client.post("/metrics/ingest", json={"points": [
+            {"restaurant_id": 8, "metric_name": "prep_time", "timestamp": "2024-01-15T00:00:00", "value": 12.0}
+        ]})
+        response = self.client.post("/analytics/forecast", json=body, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+    
+    def test_similar_restaurants(self):
+        """Test that ingested profiles can be searched for similar restaurants"""
+        points = [
+            {"restaurant_id": restaurant_id, "metric_name": "wait_time",
+             "timestamp": f"2024-02-{day:02d}T12:00:00", "value": float(scale * day)}
+            for restaurant_id, scale in [(9101, 1), (9102, 3), (9103, -2)]
+            for day in range(1, 11)
+        ]
+        self.client.post("/metrics/ingest", json={"points": points})
+        
+        response = self.client.get("/restaurants/9101/similar", params={"k": 1})
+        assert response.status_code == 200
+        assert response.json()["neighbors"][0]["restaurant_id"] == 9102
+        
+        response = self.client.get("/restaurants/9199/similar")
+        assert response.status_code == 404
+    
+    def test_fallback_correlation_has_no_etag(self, monkeypatch):
+        """Test that mock fallback results are never cached by ETag"""
+        async def unavailable(restaurant_id):
+            return None
+        
+        monkeypatch.setattr(main.analytics_service, "fetch_restaurant_data", unavailable)
+        response = self.client.post("/analytics/correlation", json={"restaurant_id": 3})
+        assert response.status_code == 200
+        assert response.json()["synthetic"]
+        assert "etag" not in response.headers
+        
+        response = self.client.post(
+            "/analytics/correlation", json={"restaurant_id": 3}, headers={"If-None-Match": "*"}
+        )
+        assert response.status_code == 200
+    
+    def test_correlation_etag_follows_fetched_data(self, monkeypatch):
+        """Test that the correlation ETag changes when the .NET data changes"""
+        revenue = [{"date": f"2024-01-{day:02d}", "totalRevenue": 1000.0 + 10 * day} for day in range(1, 21)]
+        metrics = [
+            {"timestamp": f"2024-01-{day:02d}T12:00:00", "metricName": "wait_time", "value": float(30 - day)}
+            for day in range(1, 21)
+        ]
+        
+        async def fetch(restaurant_id, days=90):
+            return revenue, metrics
+        
+        monkeypatch.setattr(main.analytics_service, "_fetch_restaurant_data", fetch)
+        body = {"restaurant_id": 4, "metrics": ["wait_time"]}
+        response = self.client.post("/analytics/correlation", json=body)
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        
+        response = self.client.post("/analytics/correlation", json=body, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        
+        revenue[-1]["totalRevenue"] = 5000.0
+        response = self.client.post("/analytics/correlation", json=body, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+    
+    def test_rejected_correlation_never_fetches_data(self, monkeypatch):
+        """Test that an overloaded correlation endpoint fails fast without calling the .NET API"""
+        calls = []
+        
+        async def fetch(restaurant_id, days=90):
+            calls.append(restaurant_id)
+            return [], []
+        
+        monkeypatch.setattr(main.analytics_service, "_fetch_restaurant_data", fetch)
+        gate = admission_controller.gate("correlation")
+        max_concurrent, max_queue = gate.limits.max_concurrent, gate.limits.max_queue
+        gate.limits.max_concurrent, gate.limits.max_queue = 0, 0
+        try:
+            response = self.client.post(
+                "/analytics/correlation",
+                json={"restaurant_id": 5},
+                headers={"If-None-Match": '"stale"'}
+            )
+        finally:
+            gate.limits.max_concurrent, gate.limits.max_queue = max_concurrent, max_queue
+        assert response.status_code == 503
+        assert calls == []
+    
+    def test_profiled_correlation_reports_cpu(self, monkeypatch):
+        """Test that correlation profiles run in the thread pool and report CPU time"""
+        async def unavailable(restaurant_id):
+            return None
+        
+        monkeypatch.setattr(main.analytics_service, "fetch_restaurant_data", unavailable)
+        response = self.client.post(
+            "/analytics/correlation", json={"restaurant_id": 6}, headers={"X-Profile": "true"}
+        )
+        assert response.status_code == 200
+        
+        profile = self.client.get(f"/admin/profiles/{response.headers['x-profile-id']}").json()
+        assert profile["calls"] == ["AnalyticsService.calculate_revenue_correlations"]
+        assert profile["cpu_ms"] is not None
+    
     # Add your API tests here
\ No newline at end of file
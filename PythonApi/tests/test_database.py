@@ -19,4 +19,16 @@ class TestInMemoryDatabase:
         assert self.db is not None
         assert hasattr(self.db, '_lock')
     
+    def test_data_version_starts_at_zero(self):
+        """Test that restaurants without ingested data have version 0"""
+        assert self.db.get_data_version(1) == 0
+    
+    def test_bump_data_versions(self):
+        """Test that each restaurant is bumped once per call"""
+        self.db.bump_data_versions([1, 1, 2])
+        self.db.bump_data_versions([1])
+        assert self.db.get_data_version(1) == 2
+        assert self.db.get_data_version(2) == 1
+        assert self.db.get_data_version(3) == 0
+    
     # Add your database tests here
\ No newline at end of file
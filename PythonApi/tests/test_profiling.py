@@ -0,0 +1,112 @@
+import pytest
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from profiling import RequestProfiler, profiled
+
+
+@profiled
+def busy_work(duration):
+    """Spin the CPU for roughly the given number of seconds"""
+    deadline = time.perf_counter() + duration
+    total = 0
+    while time.perf_counter() < deadline:
+        total += 1
+    return total
+
+
+@profiled
+async def busy_coroutine(duration):
+    """Await briefly, then spin the CPU on the event loop"""
+    await asyncio.sleep(duration)
+    return busy_work.__wrapped__(duration)
+
+
+class TestRequestProfiler:
+    """Unit tests for the request profiler"""
+    
+    def setup_method(self):
+        """Create a fresh profiler for each test"""
+        self.profiler = RequestProfiler(interval=0.002, buffer_size=2)
+    
+    def test_profiled_call_without_session(self):
+        """Test that decorated functions behave normally when profiling is off"""
+        assert busy_work(0.0) >= 0
+        assert self.profiler.list_profiles() == []
+    
+    def test_session_captures_call_tree(self):
+        """Test that sampled stacks include the profiled function"""
+        session = self.profiler.start("test")
+        busy_work(0.05)
+        record = self.profiler.finish(session)
+        
+        assert record.samples > 0
+        assert record.calls == [busy_work.__qualname__]
+        assert record.wall_ms >= 50
+        functions = [child.function for child in record.call_tree.children[0].children]
+        assert "busy_work" in functions
+        assert self.profiler.get_profile(record.id) == record
+    
+    def test_sample_rate(self):
+        """Test that explicit requests are always profiled"""
+        assert self.profiler.should_profile(True)
+        assert not self.profiler.should_profile(False)
+        assert RequestProfiler(sample_rate=1.0).should_profile(False)
+    
+    def test_ring_buffer_is_bounded(self):
+        """Test that only the most recent profiles are kept"""
+        ids = []
+        for _ in range(3):
+            ids.append(self.profiler.finish(self.profiler.start("test")).id)
+        
+        assert [summary.id for summary in self.profiler.list_profiles()] == ids[:0:-1]
+        assert self.profiler.get_profile(ids[0]) is None
+    
+    def test_overlapping_sessions_do_not_share_memory_tracing(self):
+        """Test that only the first of two overlapping sessions traces memory"""
+        first = self.profiler.start("first")
+        second = self.profiler.start("second")
+        second_record = self.profiler.finish(second)
+        first_record = self.profiler.finish(first)
+        
+        assert first_record.peak_memory_kb is not None
+        assert second_record.peak_memory_kb is None
+        assert second_record.allocations == []
+        
+        third_record = self.profiler.finish(self.profiler.start("third"))
+        assert third_record.peak_memory_kb is not None
+    
+    def test_detached_session_finishes_in_worker_thread(self):
+        """Test that a detached session stops recording and can be finished off-thread"""
+        session = self.profiler.start("worker")
+        busy_work(0.01)
+        self.profiler.detach(session)
+        busy_work(0.0)
+        
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            record = pool.submit(self.profiler.finish, session).result()
+        
+        assert record.calls == [busy_work.__qualname__]
+        assert record.peak_memory_kb is not None
+        assert self.profiler.get_profile(record.id) == record
+    
+    def test_async_call_profile(self):
+        """Test that coroutines are sampled while running and marked suspended while awaiting"""
+        async def scenario():
+            session = self.profiler.start("async")
+            await busy_coroutine(0.03)
+            return self.profiler.finish(session)
+        
+        record = asyncio.run(scenario())
+        
+        assert record.calls == [busy_coroutine.__qualname__]
+        assert record.cpu_ms is None
+        assert record.call_tree.cpu_ms is None
+        nodes = {child.function: child for child in record.call_tree.children}
+        assert "<suspended>" in nodes
+        running = [child.function for child in nodes["async_wrapper"].children]
+        assert running == ["busy_coroutine"]
@@ -0,0 +1,141 @@
+import pytest
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+from models import MetricPoint
+from similarity_index import SimilarityIndex
+
+
+def profile_points(restaurant_id, curves, start=datetime(2024, 1, 1)):
+    """Daily points for each channel curve, keyed by metric name"""
+    return [
+        MetricPoint(
+            restaurant_id=restaurant_id,
+            metric_name=metric_name,
+            timestamp=start + timedelta(days=day),
+            value=float(value)
+        )
+        for metric_name, curve in curves.items()
+        for day, value in enumerate(curve)
+    ]
+
+
+class TestSimilarityIndex:
+    """Unit tests for the cross-restaurant similarity index"""
+    
+    def setup_method(self):
+        """Create a small index for each test"""
+        self.index = SimilarityIndex(window_days=14, min_days=7)
+        self.days = np.arange(14)
+    
+    def test_unknown_restaurant(self):
+        """Test that restaurants without a profile are not queryable"""
+        assert self.index.query(1) is None
+    
+    def test_shape_matters_not_scale(self):
+        """Test that z-normalization matches curves with the same shape"""
+        rising, falling = self.days, -self.days
+        self.index.ingest(profile_points(1, {"prep_time": 10 + rising, "revenue": 1000 + 50 * rising}))
+        self.index.ingest(profile_points(2, {"prep_time": 100 + 5 * rising, "totalRevenue": 90 * rising}))
+        self.index.ingest(profile_points(3, {"prep_time": 10 + falling, "revenue": 1000 + 50 * falling}))
+        
+        neighbors = self.index.query(1, k=2)
+        
+        assert [neighbor.restaurant_id for neighbor in neighbors] == [2, 3]
+        assert neighbors[0].similarity == pytest.approx(1.0, abs=1e-5)
+        assert neighbors[1].similarity == pytest.approx(-1.0, abs=1e-5)
+        assert neighbors[0].distance < neighbors[1].distance
+        assert [n.restaurant_id for n in self.index.query(1, k=2, metric="euclidean")] == [2, 3]
+    
+    def test_incremental_update(self):
+        """Test that new data moves a restaurant to its new neighbours"""
+        self.index.ingest(profile_points(1, {"wait_time": np.sin(self.days)}))
+        self.index.ingest(profile_points(2, {"wait_time": np.cos(self.days)}))
+        self.index.ingest(profile_points(3, {"wait_time": np.sin(self.days)}))
+        assert self.index.query(1, k=1)[0].restaurant_id == 3
+        
+        # Two more weeks of data push the old curve out of the window
+        later = datetime(2024, 1, 15)
+        self.index.ingest(profile_points(1, {"wait_time": np.cos(self.days + 14)}, start=later))
+        self.index.ingest(profile_points(2, {"wait_time": np.cos(self.days + 14)}, start=later))
+        assert self.index.query(1, k=1)[0].restaurant_id == 2
+        assert len(self.index) == 3
+    
+    def test_restaurant_without_recent_data_is_dropped(self):
+        """Test that a restaurant whose window empties out is removed from the index"""
+        for restaurant_id, curve in [(1, np.sin(self.days)), (2, np.cos(self.days)), (3, np.sin(self.days))]:
+            self.index.ingest(profile_points(restaurant_id, {"wait_time": curve}))
+        assert len(self.index) == 3
+        
+        # A single point two months later slides every earlier day out of the window
+        self.index.ingest(profile_points(1, {"wait_time": [1.0]}, start=datetime(2024, 3, 1)))
+        
+        assert self.index.query(1) is None
+        assert len(self.index) == 2
+        assert [n.restaurant_id for n in self.index.query(2, k=5)] == [3]
+        assert self.index.query(3, k=1)[0].similarity == pytest.approx(self.index.query(2, k=1)[0].similarity)
+    
+    def test_requires_minimum_days(self):
+        """Test that channels with too few days are not indexed"""
+        self.index.ingest(profile_points(1, {"prep_time": self.days[:3]}))
+        assert self.index.query(1) is None
+    
+    def test_approximate_query_matches_exact(self):
+        """Test that approximate pruning finds the same clear nearest neighbours"""
+        rng = np.random.default_rng(0)
+        prototypes = rng.normal(size=(5, 14))
+        for restaurant_id in range(200):
+            curve = prototypes[restaurant_id % 5] + 0.1 * rng.normal(size=14)
+            self.index.ingest(profile_points(restaurant_id, {"customer_satisfaction": curve}))
+        
+        exact = self.index.query(0, k=5)
+        approximate = self.index.query(0, k=5, approximate=True, candidates=20)
+        
+        assert len(self.index) == 200
+        assert all(neighbor.restaurant_id % 5 == 0 for neighbor in exact)
+        assert all(neighbor.restaurant_id % 5 == 0 for neighbor in approximate)
+    
+    def test_approximate_query_returns_k_neighbours(self):
+        """Test that the candidate pool grows with k"""
+        rng = np.random.default_rng(1)
+        for restaurant_id in range(300):
+            self.index.ingest(profile_points(restaurant_id, {"wait_time": rng.normal(size=14)}))
+        
+        assert len(self.index.query(0, k=100, approximate=True)) == 100
+        assert len(self.index.query(0, k=100, metric="euclidean", approximate=True)) == 100
+    
+    def test_approximate_euclidean_ranks_by_distance(self):
+        """Test that euclidean pruning keeps close vectors with fewer channels"""
+        rng = np.random.default_rng(3)
+        curve = rng.normal(size=14)
+        # Restaurant 0 only has one channel; its best euclidean match also has only that channel
+        self.index.ingest(profile_points(0, {"wait_time": curve}))
+        self.index.ingest(profile_points(1, {"wait_time": curve + 0.05 * rng.normal(size=14)}))
+        for restaurant_id in range(2, 200):
+            self.index.ingest(profile_points(restaurant_id, {
+                channel: curve + rng.normal(size=14) for channel in self.index.channels
+            }))
+        
+        exact = self.index.query(0, k=1, metric="euclidean")
+        approximate = self.index.query(0, k=1, metric="euclidean", approximate=True, candidates=8)
+        assert exact[0].restaurant_id == approximate[0].restaurant_id == 1
+    
+    def test_approximate_cosine_ranks_by_angle(self):
+        """Test that cosine pruning is not biased towards vectors with more channels"""
+        rng = np.random.default_rng(4)
+        curve = rng.normal(size=14)
+        self.index.ingest(profile_points(0, {"wait_time": curve}))
+        self.index.ingest(profile_points(1, {"wait_time": curve + 0.5 * rng.normal(size=14)}))
+        # Larger dot products with restaurant 0 but much wider angles
+        for restaurant_id in range(2, 200):
+            self.index.ingest(profile_points(restaurant_id, {
+                channel: curve + 0.3 * rng.normal(size=14) if channel == "wait_time" else rng.normal(size=14)
+                for channel in self.index.channels
+            }))
+        
+        exact = self.index.query(0, k=1)
+        approximate = self.index.query(0, k=1, approximate=True, candidates=8)
+        assert exact[0].restaurant_id == approximate[0].restaurant_id == 1